@@ -1,10 +1,18 @@
+import os
 from fastapi import FastAPI, HTTPException, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy.sql import text
-import pandas as pd
+from itertools import islice
 
-from database import get_db, engine
-from llm_services import generate_sql_from_natural_language
+from database import get_db
+from llm_services import (
+    generate_sql_from_natural_language, embed_query, match_sql_template, NL2SQL_EXAMPLES
+)
+from semantic_cache import SemanticSQLCache, OnnxEmbedder
+from config import (
+    EMBEDDING_DIMENSION, EMBEDDING_ONNX_DIR, SEMANTIC_CACHE_INDEX_PATH,
+    SEMANTIC_CACHE_THRESHOLD, CHAT_MAX_ROWS
+)
 
 app = FastAPI(
     title="AI Incentives Challenge API",
@@ -12,16 +20,71 @@ app = FastAPI(
     version="1.0.0",
 )
 
-def get_db_schema() -> str:
+def load_local_embedder():
+    """Loads the local ONNX sentence embedder once; returns None if the model files are not available."""
+    if not os.path.exists(os.path.join(EMBEDDING_ONNX_DIR, "model.onnx")):
+        print(f"[Semantic Cache] No local embedding model in '{EMBEDDING_ONNX_DIR}'. Using the Gemini embedding API.")
+        print("  Run 'python main.py embedding-model' to download it.")
+        return None
+    try:
+        return OnnxEmbedder(EMBEDDING_ONNX_DIR)
+    except Exception as e:
+        print(f"[ERROR] Failed to load local embedding model: {e}. Using the Gemini embedding API.")
+        return None
+
+local_embedder = load_local_embedder()
+
+if local_embedder is not None:
+    sql_cache = SemanticSQLCache(
+        embed_fn=local_embedder.embed,
+        embed_batch_fn=local_embedder.embed_batch,
+        dimension=local_embedder.dimension,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        index_path=SEMANTIC_CACHE_INDEX_PATH
+    )
+else:
+    sql_cache = SemanticSQLCache(
+        embed_fn=embed_query,
+        dimension=EMBEDDING_DIMENSION,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        index_path=SEMANTIC_CACHE_INDEX_PATH
+    )
+
+@app.on_event("startup")
+def warm_up_sql_cache():
+    """
+    Seeds the semantic SQL cache with the NL2SQL few-shot examples.
+    Skipped without the local embedder: seeding through the Gemini embedding API would block startup on the network.
+    """
+    if local_embedder is None:
+        print("[Semantic Cache] Skipping warm-up without the local embedding model.")
+        return
+    sql_cache.seed([(question, sql) for question, sql in NL2SQL_EXAMPLES if "AS error" not in sql])
+
+@app.on_event("shutdown")
+def persist_sql_cache():
+    """Writes the semantic SQL cache to disk so it survives server restarts."""
+    try:
+        sql_cache.save()
+    except Exception as e:
+        print(f"[ERROR] Failed to persist semantic SQL cache: {e}")
+
+_schema_cache = {"schema": None}
+
+def get_db_schema(db: Session) -> str:
     """
     Extracts the CREATE TABLE statements from the SQLite database to provide
     context to the LLM for generating SQL queries.
+    The schema is static between deployments, so it is read once (on the caller's
+    session) and memoized; failures and empty schemas are not memoized.
     """
+    if _schema_cache["schema"]:
+        return _schema_cache["schema"]
     try:
-        with engine.connect() as connection:
-            query = text("SELECT sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = connection.execute(query).fetchall()
-            return "\n".join(table[0] for table in tables if table[0])
+        query = text("SELECT sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+        tables = db.execute(query).fetchall()
+        _schema_cache["schema"] = "\n".join(table[0] for table in tables if table[0])
+        return _schema_cache["schema"]
     except Exception as e:
         print(f"[ERROR] Failed to get DB schema: {e}")
         return ""
@@ -32,36 +95,58 @@ def chat_with_data(query: str, db: Session = Depends(get_db)):
     This is the main chatbot endpoint. It takes a user's question in plain text,
     converts it to an SQL query using an LLM, executes it against the database,
     and returns the result in a structured format.
+    At most CHAT_MAX_ROWS rows are returned; "truncated" tells whether more rows matched.
 
     - **query**: The user's question (e.g., "Quais as 5 melhores empresas para o incentivo X?").
     """
     print(f"Received chat query: '{query}'")
 
-    schema = get_db_schema()
-    if not schema:
-        raise HTTPException(status_code=500, detail="Could not retrieve database schema.")
-
-    sql_query = generate_sql_from_natural_language(query, schema)
-    print(f"Generated SQL: {sql_query}")
+    sql_params = None
+    generated_by_llm = False
+    template = match_sql_template(query)
+    if template is not None:
+        sql_query, sql_params = template
+        print(f"Matched SQL template with parameters: {sql_params}")
+    else:
+        sql_query = sql_cache.lookup(query)
+        if sql_query is None:
+            schema = get_db_schema(db)
+            if not schema:
+                raise HTTPException(status_code=500, detail="Could not retrieve database schema.")
+            sql_query = generate_sql_from_natural_language(query, schema)
+            generated_by_llm = True
+        print(f"Generated SQL: {sql_query}")
 
     if "error" in sql_query.lower() or not sql_query.lstrip().upper().startswith("SELECT"):
         raise HTTPException(status_code=400, detail=f"Could not process query. Reason: {sql_query}")
 
     try:
-        with engine.connect() as connection:
-            result_df = pd.read_sql_query(sql_query, connection)
+        result = db.connection().exec_driver_sql(
+            sql_query,
+            sql_params,
+            execution_options={"stream_results": True, "max_row_buffer": 1000}
+        )
+        columns = list(result.keys())
+        rows = list(islice(result, CHAT_MAX_ROWS))
+        truncated = result.fetchone() is not None
+        result.close()
+
+        if generated_by_llm:
+            sql_cache.add(query, sql_query)
 
-        if result_df.empty:
+        if not rows:
             return {
                 "question": query,
                 "response": "A sua pesquisa não encontrou resultados.",
+                "truncated": False,
                 "data": []
             }
 
         response_data = {
             "question": query,
             "response": "Aqui estão os resultados da sua pesquisa:",
-            "data": result_df.to_dict(orient='records')
+            "truncated": truncated,
+            "data": [dict(zip(columns, row)) for row in rows]
         }
         return response_data
 
@@ -69,6 +154,20 @@ def chat_with_data(query: str, db: Session = Depends(get_db)):
         print(f"[ERROR] Error executing generated SQL: {e}")
         raise HTTPException(status_code=500, detail=f"An error occurred while executing the query: {str(e)}")
 
+@app.post("/admin/reload-schema", summary="Reload the cached database schema")
+def reload_schema(db: Session = Depends(get_db)):
+    """
+    Discards the memoized database schema (and the SQL generated against it)
+    after the database structure has changed.
+    """
+    _schema_cache["schema"] = None
+    sql_cache.clear()
+    warm_up_sql_cache()
+    schema = get_db_schema(db)
+    if not schema:
+        raise HTTPException(status_code=500, detail="Could not retrieve database schema.")
+    return {"message": "Database schema reloaded.", "tables": schema.count("CREATE TABLE")}
+
 @app.get("/", summary="Root endpoint")
 def read_root():
     """Provides a welcome message and directs users to the API documentation."""
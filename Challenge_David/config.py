@@ -4,3 +4,28 @@ DATABASE_URL = "sqlite:///incentives.db"
 DB_FILE_NAME = "incentives.db"
 
 LLM_MODEL_NAME = "gemini-1.5-flash-latest"
+
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+EMBEDDING_DIMENSION = 768
+
+SEMANTIC_CACHE_INDEX_PATH = "sql_cache.faiss"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+
+LLM_MAX_CONCURRENCY = 8
+
+LLM_CACHE_DIR = "llm_cache"
+LLM_CACHE_EXPIRE_SECONDS = 30 * 86400
+
+CHAT_MAX_ROWS = 500
+
+# Directory with an ONNX export of sentence-transformers/all-MiniLM-L6-v2 (model.onnx + tokenizer.json),
+# downloaded from EMBEDDING_ONNX_REPO with `python main.py embedding-model`.
+# When it is missing, the semantic SQL cache falls back to the Gemini embedding API.
+EMBEDDING_ONNX_DIR = "models/all-MiniLM-L6-v2"
+EMBEDDING_ONNX_REPO = "sentence-transformers/all-MiniLM-L6-v2"
+
+SCRAPER_MAX_WORKERS = 4
+SCRAPER_HTTP_MAX_CONNECTIONS = 10
+SCRAPER_COMMIT_BATCH_SIZE = 20
+LINKS_CACHE_PATH = "links.json"
+LINKS_CACHE_TTL_SECONDS = 24 * 3600
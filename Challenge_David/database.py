@@ -1,12 +1,67 @@
+import re
 import pandas as pd
-import numpy as np
-import json
-from sqlalchemy import create_engine, Column, Integer, String, Text, Float, Date, ForeignKey
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Text, Float, Date, ForeignKey, Index
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.sql import text
 from config import DATABASE_URL
 
 Base = declarative_base()
 
+# The city is the trailing run of capitalized words, r'([A-Z][a-z]+(?: [A-Z][a-z]+)*)$'.
+# It is matched on the reversed string so the regex is anchored at the end of the name
+# instead of retrying a '$'-anchored search from every start position.
+CITY_PATTERN_REVERSED = re.compile(r'\n?((?:[a-z]+[A-Z] )*[a-z]+[A-Z])')
+
+COMPANY_CSV_COLUMNS = {
+    'Company Name': 'company_name',
+    'NIF Code': 'nif_code',
+    'Last available year': 'last_available_year',
+    'Operating revenue / turnover\nth EUR\nLast avail. yr': 'operating_revenue_th_eur',
+    'EBITDA\nth EUR\nLast avail. yr': 'ebitda_th_eur',
+    'P/L before tax\nth EUR\nLast avail. yr': 'pl_before_tax_th_eur',
+    'Latest number of employees': 'latest_number_of_employees',
+    'NACE Rev. 2 Secondary Code(s)': 'nace_secondary_codes',
+    'NACE Rev. 2 Secondary Label(s)': 'nace_secondary_labels',
+    'CAE Rev.3 Primary Code': 'cae_primary_code',
+    'CAE Rev.3 Primary Label': 'cae_primary_label',
+    'CAE Rev.3 Secondary Code(s)': 'cae_secondary_codes',
+    'CAE Rev.3 Secondary Label(s)': 'cae_secondary_labels',
+    'Native trade description': 'native_trade_description',
+    'English trade description': 'english_trade_description',
+    'Import / Export': 'import_export',
+    'email portugal': 'email_portugal',
+    'Web site': 'website',
+    'Telephone': 'telephone',
+    'Postal Code': 'postal_code',
+    'DM\nFull name': 'dm_full_name',
+    'DM Job title (in English)': 'dm_job_title',
+    'Brand Name': 'brand_name',
+    'Subsidiary - Name': 'subsidiary_name',
+    'Subsidiary - Direct %': 'subsidiary_direct_percent',
+    'Shareholder - Name': 'shareholder_name',
+    'Shareholder - Direct %': 'shareholder_direct_percent'
+}
+
+COMPANY_NUMERIC_COLUMNS = [
+    'last_available_year', 'operating_revenue_th_eur', 'ebitda_th_eur',
+    'pl_before_tax_th_eur', 'latest_number_of_employees',
+    'subsidiary_direct_percent', 'shareholder_direct_percent'
+]
+COMPANY_INTEGER_COLUMNS = ['latest_number_of_employees', 'last_available_year']
+COMPANY_DECIMAL_COMMA_COLUMNS = ['subsidiary_direct_percent', 'shareholder_direct_percent']
+
+# Everything except the dot-decimal figures is read as text, so pandas skips type
+# inference for those columns and codes such as '1071' are never turned into floats.
+COMPANY_CSV_DTYPES = {
+    csv_column: str for csv_column, column in COMPANY_CSV_COLUMNS.items()
+    if column not in COMPANY_NUMERIC_COLUMNS or column in COMPANY_DECIMAL_COMMA_COLUMNS
+}
+CSV_CHUNK_SIZE = 50_000
+
+# Secondary code lists are stored as space-separated codes, e.g. "10712 10711".
+CODE_LIST_COLUMNS = ['nace_secondary_codes', 'cae_secondary_codes']
+
 class Incentive(Base):
     """Represents the 'incentives' table in the database."""
     __tablename__ = 'incentives'
@@ -20,12 +75,23 @@ class Incentive(Base):
     end_date = Column(Date)
     total_budget = Column(Float)
     source_link = Column(String)
+    content_hash = Column(String(64), index=True)
 
     matches = relationship("Match", back_populates="incentive", cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Incentive(id={self.incentive_id}, title='{self.title}')>"
 
+class PageCache(Base):
+    """HTTP validators of scraped incentive pages, used for conditional GETs on reruns."""
+    __tablename__ = 'page_cache'
+    url = Column(String, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)
+
+    def __repr__(self):
+        return f"<PageCache(url='{self.url}', etag='{self.etag}')>"
+
 class Company(Base):
     """Represents the 'companies' table in the database."""
     __tablename__ = 'companies'
@@ -38,7 +104,7 @@ class Company(Base):
     latest_number_of_employees = Column(Integer)
     nace_secondary_codes = Column(String)
     nace_secondary_labels = Column(String)
-    cae_primary_code = Column(String)
+    cae_primary_code = Column(String, index=True)
     cae_primary_label = Column(String)
     cae_secondary_codes = Column(String)
     cae_secondary_labels = Column(String)
@@ -66,9 +132,12 @@ class Company(Base):
 class Match(Base):
     """Represents the 'matches' table, linking incentives and companies."""
     __tablename__ = 'matches'
+    __table_args__ = (
+        Index('ix_matches_incentive_score', 'incentive_id', 'score'),
+    )
     match_id = Column(Integer, primary_key=True, autoincrement=True)
-    incentive_id = Column(Integer, ForeignKey('incentives.incentive_id'), nullable=False)
-    company_nif = Column(String, ForeignKey('companies.nif_code'), nullable=False)
+    incentive_id = Column(Integer, ForeignKey('incentives.incentive_id'), nullable=False, index=True)
+    company_nif = Column(String, ForeignKey('companies.nif_code'), nullable=False, index=True)
     score = Column(Float, nullable=False)
 
     incentive = relationship("Incentive", back_populates="matches")
@@ -77,7 +146,24 @@ class Match(Base):
     def __repr__(self):
         return f"<Match(incentive_id={self.incentive_id}, company_nif='{self.company_nif}', score={self.score})>"
 
-engine = create_engine(DATABASE_URL, echo=False)
+engine = create_engine(
+    DATABASE_URL,
+    echo=False,
+    pool_size=5,
+    connect_args={"check_same_thread": False}
+)
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Enables WAL journaling and memory-mapped I/O on every new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -91,87 +177,89 @@ def get_db():
 def create_database_and_tables():
     """Creates the database file and all defined tables if they don't exist."""
     Base.metadata.create_all(bind=engine)
+    migrate_code_lists_to_plain_text()
+    migrate_incentive_content_hash()
     print("Database and tables created successfully.")
 
+def migrate_code_lists_to_plain_text():
+    """
+    One-off migration for databases loaded before code lists were stored as plain text:
+    rewrites JSON arrays such as '["10712", "10711"]' to '10712 10711'. Safe to re-run.
+    """
+    with engine.begin() as connection:
+        for column in CODE_LIST_COLUMNS:
+            connection.execute(text(
+                f"UPDATE companies SET {column} = "
+                f"trim(replace(replace(replace(replace({column}, '[', ''), ']', ''), '\"', ''), ',', '')) "
+                f"WHERE {column} LIKE '[%'"
+            ))
+
+def migrate_incentive_content_hash():
+    """Adds the 'content_hash' column to an 'incentives' table created before it existed. Safe to re-run."""
+    if 'content_hash' in {column['name'] for column in inspect(engine).get_columns('incentives')}:
+        return
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE incentives ADD COLUMN content_hash VARCHAR(64)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_incentives_content_hash ON incentives (content_hash)"))
+
+def _extract_city(full_name: str) -> str:
+    match = CITY_PATTERN_REVERSED.match(full_name[::-1])
+    return match.group(1)[::-1] if match else 'Unknown'
+
+def _clean_company_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Renames and normalizes one chunk of the companies CSV to the 'companies' table columns."""
+    df = df.rename(columns=COMPANY_CSV_COLUMNS)
+
+    df['city'] = df['dm_full_name'].map(_extract_city, na_action='ignore').fillna('Unknown')
+
+    numeric_cols = [col for col in COMPANY_NUMERIC_COLUMNS if col in df.columns]
+    integer_cols = [col for col in COMPANY_INTEGER_COLUMNS if col in df.columns]
+    decimal_comma_cols = [col for col in COMPANY_DECIMAL_COMMA_COLUMNS if col in df.columns]
+    df[decimal_comma_cols] = df[decimal_comma_cols].replace(',', '.', regex=True)
+    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce')
+    df[integer_cols] = df[integer_cols].fillna(0).astype(int)
+
+    for col in CODE_LIST_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna('').str.split().str.join(' ')
+
+    model_columns = [c.name for c in Company.__table__.columns if c.name in df.columns]
+    return df[model_columns]
+
+def _upsert_companies(connection, df: pd.DataFrame):
+    """Writes a cleaned chunk with a single prepared UPSERT statement keyed on the NIF code."""
+    stmt = sqlite_insert(Company.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['nif_code'],
+        set_={c: stmt.excluded[c] for c in df.columns if c != 'nif_code'}
+    )
+    connection.execute(stmt, df.to_dict(orient='records'))
+
 def load_companies_from_csv(csv_path: str):
     """
     Reads company data from the provided CSV, cleans it, and loads it into the database.
     Handles all fields specified in the CSV with appropriate transformations.
+    Only the mapped columns are parsed, and the file is streamed in chunks of
+    CSV_CHUNK_SIZE rows so peak memory stays bounded for large files.
     """
-    db = SessionLocal()
     try:
-        df = pd.read_csv(csv_path)
-
-        df = df.rename(columns={
-            'Company Name': 'company_name',
-            'NIF Code': 'nif_code',
-            'Last available year': 'last_available_year',
-            'Operating revenue / turnover\nth EUR\nLast avail. yr': 'operating_revenue_th_eur',
-            'EBITDA\nth EUR\nLast avail. yr': 'ebitda_th_eur',
-            'P/L before tax\nth EUR\nLast avail. yr': 'pl_before_tax_th_eur',
-            'Latest number of employees': 'latest_number_of_employees',
-            'NACE Rev. 2 Secondary Code(s)': 'nace_secondary_codes',
-            'NACE Rev. 2 Secondary Label(s)': 'nace_secondary_labels',
-            'CAE Rev.3 Primary Code': 'cae_primary_code',
-            'CAE Rev.3 Primary Label': 'cae_primary_label',
-            'CAE Rev.3 Secondary Code(s)': 'cae_secondary_codes',
-            'CAE Rev.3 Secondary Label(s)': 'cae_secondary_labels',
-            'Native trade description': 'native_trade_description',
-            'English trade description': 'english_trade_description',
-            'Import / Export': 'import_export',
-            'email portugal': 'email_portugal',
-            'Web site': 'website',
-            'Telephone': 'telephone',
-            'Postal Code': 'postal_code',
-            'DM\nFull name': 'dm_full_name',
-            'DM Job title (in English)': 'dm_job_title',
-            'Brand Name': 'brand_name',
-            'Subsidiary - Name': 'subsidiary_name',
-            'Subsidiary - Direct %': 'subsidiary_direct_percent',
-            'Shareholder - Name': 'shareholder_name',
-            'Shareholder - Direct %': 'shareholder_direct_percent'
-        })
-
-        df['nif_code'] = df['nif_code'].astype(str)
-
-        df['city'] = df['dm_full_name'].str.extract(r'([A-Z][a-z]+(?: [A-Z][a-z]+)*)$', expand=False)
-        df['city'] = df['city'].fillna('Unknown')
-
-        numeric_cols = [
-            'last_available_year', 'operating_revenue_th_eur', 'ebitda_th_eur',
-            'pl_before_tax_th_eur', 'latest_number_of_employees',
-            'subsidiary_direct_percent', 'shareholder_direct_percent'
-        ]
-        for col in numeric_cols:
-            if col in df.columns:
-                print(f"Processing column: {col}")
-                df[col] = df[col].astype(str).str.replace(',', '.', regex=False)
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                if col in ['latest_number_of_employees', 'last_available_year']:
-                    df[col] = df[col].fillna(0).astype(int)
-                else:
-                    df[col] = df[col].fillna(np.nan)
-
-        for col in ['nace_secondary_codes', 'cae_secondary_codes']:
-            if col in df.columns:
-                df[col] = df[col].apply(lambda x: json.dumps(str(x).split()) if pd.notna(x) else json.dumps([]))
-
-        for _, row in df.iterrows():
-            company_data = row.to_dict()
-            model_columns = {c.name for c in Company.__table__.columns}
-            filtered_data = {k: v for k, v in company_data.items() if k in model_columns}
-            company = Company(**filtered_data)
-            db.merge(company)
-
-        db.commit()
-        print(f"Successfully loaded and processed {len(df)} companies into the database.")
+        total_companies = 0
+        chunks = pd.read_csv(
+            csv_path,
+            usecols=lambda column: column in COMPANY_CSV_COLUMNS,
+            dtype=COMPANY_CSV_DTYPES,
+            chunksize=CSV_CHUNK_SIZE
+        )
+        with engine.begin() as connection:
+            for chunk in chunks:
+                df = _clean_company_chunk(chunk)
+                _upsert_companies(connection, df)
+                total_companies += len(df)
+        print(f"Successfully loaded and processed {total_companies} companies into the database.")
 
     except FileNotFoundError:
         print(f"[ERROR] The file was not found at path: {csv_path}")
         raise
     except Exception as e:
-        db.rollback()
         print(f"An error occurred during CSV loading: {e}")
-        raise
-    finally:
-        db.close()
\ No newline at end of file
+        raise
\ No newline at end of file
@@ -1,6 +1,12 @@
 import google.generativeai as genai
+import re
+import asyncio
 import json
-from config import GOOGLE_API_KEY, LLM_MODEL_NAME
+import hashlib
+import numpy as np
+from functools import lru_cache
+from diskcache import Cache
+from config import GOOGLE_API_KEY, LLM_MODEL_NAME, EMBEDDING_MODEL_NAME, LLM_CACHE_DIR, LLM_CACHE_EXPIRE_SECONDS
 
 try:
     if not GOOGLE_API_KEY:
@@ -31,12 +37,23 @@ model = genai.GenerativeModel(
     safety_settings=safety_settings
 )
 
-def generate_structured_data_for_incentive(original_text: str) -> dict:
-    """
-    Uses an LLM to analyze raw incentive text and generate a structured JSON object,
-    including dates and budget information.
-    """
-    prompt = f"""
+llm_cache = Cache(LLM_CACHE_DIR)
+
+# The SDK creates its async client once and binds it to the event loop of the first call,
+# so a second asyncio.run() fails with "Event loop is closed". All async LLM work runs here instead.
+_llm_event_loop = asyncio.new_event_loop()
+
+def run_llm_tasks(coroutine):
+    """Runs a coroutine of async LLM calls to completion on the shared LLM event loop."""
+    return _llm_event_loop.run_until_complete(coroutine)
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of a text, used to recognize unchanged page content."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Static instructions for incentive extraction. They are the same for every page and come first,
+# so every request shares an identical prompt prefix; only the page text at the end varies.
+INCENTIVE_EXTRACTION_INSTRUCTIONS = """
     Analyze the following text from a Portuguese public incentive document. Your task is to extract key information and return it as a single, valid JSON object. Do not add any text or formatting outside of the JSON object itself.
 
     The JSON object must have these exact keys:
@@ -55,12 +72,38 @@ def generate_structured_data_for_incentive(original_text: str) -> dict:
 
     Here is the text to analyze:
     ---
-    {original_text}
+"""
+
+INCENTIVE_EXTRACTION_KEYS = (
+    "caes", "geographic_location", "dimension", "type_of_investment", "object", "criterios",
+    "publication_date", "start_date", "end_date", "total_budget"
+)
+
+def _is_valid_incentive_data(structured_data) -> bool:
+    """True for a JSON object with every key requested by INCENTIVE_EXTRACTION_INSTRUCTIONS."""
+    return isinstance(structured_data, dict) and all(key in structured_data for key in INCENTIVE_EXTRACTION_KEYS)
+
+async def generate_structured_data_for_incentive(original_text: str) -> dict:
+    """
+    Uses an LLM to analyze raw incentive text and generate a structured JSON object,
+    including dates and budget information.
+    Results are cached on disk by content hash, so re-scraping an unchanged page skips the LLM call.
+    """
+    cache_key = f"incentive:{content_hash(original_text)}"
+    cached_data = llm_cache.get(cache_key)
+    if _is_valid_incentive_data(cached_data):
+        return cached_data
+
+    prompt = f"""{INCENTIVE_EXTRACTION_INSTRUCTIONS}    {original_text}
     ---
     """
     try:
-        response = model.generate_content(prompt)
-        return json.loads(response.text)
+        response = await model.generate_content_async(prompt)
+        structured_data = json.loads(response.text)
+        if not _is_valid_incentive_data(structured_data):
+            raise ValueError(f"Unexpected structured data format: {response.text[:200]}")
+        llm_cache.set(cache_key, structured_data, expire=LLM_CACHE_EXPIRE_SECONDS)
+        return structured_data
     except Exception as e:
         print(f"  [LLM Error] Failed to generate structured data: {e}")
         return {
@@ -70,11 +113,119 @@ def generate_structured_data_for_incentive(original_text: str) -> dict:
             "end_date": None, "total_budget": None
         }
 
-def generate_sql_from_natural_language(query: str, db_schema: str) -> str:
+@lru_cache(maxsize=1024)
+def embed_query(query: str) -> np.ndarray:
     """
-    Converts a user's natural language question into a safe SQLite query (NL2SQL).
+    Embeds a user question for semantic similarity lookups.
+    Exact repeats of a question are served from memory without calling the API.
     """
-    prompt = f"""
+    result = genai.embed_content(
+        model=EMBEDDING_MODEL_NAME,
+        content=query,
+        task_type="semantic_similarity"
+    )
+    vector = np.asarray(result['embedding'], dtype=np.float32)
+    vector.setflags(write=False)
+    return vector
+
+MAX_TEMPLATE_LIMIT = 100
+
+# Captured values must be unambiguous: a quoted incentive title, or a city written as capitalized words
+# ("Vila Nova de Gaia"). Anything else, such as a trailing "com mais de 100 empregados", falls through to the LLM.
+QUOTED_TITLE = r"[\"'“‘«][^\"'“”‘’«»]+[\"'”’»]"
+CAPITALIZED_NAME = r"(?-i:[A-ZÀ-Ý][\w'-]*(?:\s+(?:(?:de|do|da|dos|das)\s+)?[A-ZÀ-Ý][\w'-]*)*)"
+
+# Question shapes answered with fixed, parameterized SQL instead of an LLM call.
+# Each entry is (pattern, SQL with named placeholders, default parameters).
+SQL_TEMPLATES = [
+    (
+        re.compile(
+            r"^(?:quais\s+(?:são\s+)?)?(?:os\s+)?(?P<limit>\d+)\s+incentivos\s+com\s+(?:o\s+)?maior(?:es)?\s+orçamentos?\s*\??$"
+            r"|^(?:what\s+are\s+)?(?:the\s+)?top\s+(?P<limit_en>\d+)\s+incentives\s+by\s+budget\s*\??$",
+            re.IGNORECASE
+        ),
+        "SELECT title, total_budget FROM incentives ORDER BY total_budget DESC LIMIT :limit;",
+        {"limit": 5}
+    ),
+    (
+        re.compile(
+            r"^(?:quais\s+(?:são\s+)?)?(?:as\s+)?(?:(?P<limit>\d+)\s+)?melhores\s+empresas\s+para\s+o\s+incentivo\s+(?P<title>" + QUOTED_TITLE + r")\s*\??$"
+            r"|^(?:what\s+are\s+)?(?:the\s+)?(?:top|best)\s+(?:(?P<limit_en>\d+)\s+)?companies\s+for\s+(?:the\s+)?incentive\s+(?P<title_en>" + QUOTED_TITLE + r")\s*\??$",
+            re.IGNORECASE
+        ),
+        "SELECT T2.company_name, T1.score FROM matches AS T1 "
+        "JOIN companies AS T2 ON T1.company_nif = T2.nif_code "
+        "JOIN incentives AS T3 ON T1.incentive_id = T3.incentive_id "
+        "WHERE T3.title LIKE '%' || :title || '%' ORDER BY T1.score DESC LIMIT :limit;",
+        {"limit": 10}
+    ),
+    (
+        re.compile(
+            r"^(?:mostra-me\s+|lista\s+)?(?:quais\s+(?:são\s+)?)?(?:as\s+)?empresas\s+(?:da|na)\s+cidade\s+(?:de\s+)?(?P<city>" + CAPITALIZED_NAME + r")\s*\??$"
+            r"|^(?:show\s+(?:me\s+)?|list\s+)?(?:all\s+)?(?:the\s+)?companies\s+in\s+(?:the\s+)?city\s+(?:of\s+)?(?P<city_en>" + CAPITALIZED_NAME + r")\s*\??$",
+            re.IGNORECASE
+        ),
+        "SELECT company_name, english_trade_description FROM companies WHERE city LIKE '%' || :city || '%';",
+        {}
+    ),
+]
+
+def match_sql_template(query: str):
+    """
+    Answers common question shapes (top incentives by budget, best companies for an
+    incentive, companies in a city) without the LLM.
+    Returns a (sql, params) tuple whose values are bound by the driver, or None if no template applies.
+    """
+    for pattern, sql, defaults in SQL_TEMPLATES:
+        match = pattern.search(query.strip())
+        if not match:
+            continue
+        params = dict(defaults)
+        for name, value in match.groupdict().items():
+            if value is not None:
+                params[name.removesuffix('_en')] = value.strip().strip('\'"“”‘’«»')
+        if 'limit' in params:
+            params['limit'] = min(int(params['limit']), MAX_TEMPLATE_LIMIT)
+        return sql, params
+    return None
+
+NL2SQL_EXAMPLES = [
+    (
+        "Quais os 5 incentivos com maior orçamento?",
+        "SELECT title, total_budget FROM incentives ORDER BY total_budget DESC LIMIT 5;"
+    ),
+    (
+        "Mostra-me empresas de Lisboa do setor da restauração.",
+        "SELECT company_name, english_trade_description FROM companies WHERE city LIKE '%Lisboa%' AND (cae_primary_label LIKE '%restauração%' OR cae_primary_label LIKE '%restaurant%');"
+    ),
+    (
+        "Quais as melhores empresas para o incentivo 'Apoio à Digitalização'?",
+        "SELECT T2.company_name, T1.score FROM matches AS T1 JOIN companies AS T2 ON T1.company_nif = T2.nif_code JOIN incentives AS T3 ON T1.incentive_id = T3.incentive_id WHERE T3.title LIKE '%Apoio à Digitalização%' ORDER BY T1.score DESC LIMIT 10;"
+    ),
+    (
+        "Quais as 5 melhores empresas para o incentivo 05/C13-i01/2023 PAE+S 2023 (1.º Aviso)?",
+        "SELECT T2.company_name, T1.score FROM matches AS T1 JOIN companies AS T2 ON T1.company_nif = T2.nif_code JOIN incentives AS T3 ON T1.incentive_id = T3.incentive_id WHERE T3.title = '05/C13-i01/2023 PAE+S 2023 (1.º Aviso)' ORDER BY T1.score DESC LIMIT 5;"
+    ),
+    (
+        "delete all companies",
+        "SELECT 'Data modification queries are not allowed.' AS error;"
+    ),
+]
+
+sql_generation_config = genai.types.GenerationConfig(
+    temperature=0.2,
+    top_p=1,
+    top_k=1,
+    max_output_tokens=4096,
+    response_mime_type="text/plain"
+)
+
+def build_nl2sql_preamble(db_schema: str) -> str:
+    """Builds the static part of the NL2SQL prompt: instructions, schema and few-shot examples."""
+    examples = "\n\n".join(
+        f"""    User Question: "{question}"\n    SQL Query: {sql}""" for question, sql in NL2SQL_EXAMPLES
+    )
+    return f"""
     You are an expert SQLite developer. Your task is to convert a user's question into a valid SQLite query based on the provided database schema.
     Your response MUST be only the SQL query. Do not add explanations, markdown formatting, or any other text.
     You are ONLY allowed to generate `SELECT` statements. Any user request that implies data modification (INSERT, UPDATE, DELETE, DROP) must result in the query `SELECT 'Data modification queries are not allowed.' AS error;`.
@@ -85,36 +236,21 @@ def generate_sql_from_natural_language(query: str, db_schema: str) -> str:
     ---
 
     Here are some examples to guide you:
-    User Question: "Quais os 5 incentivos com maior orçamento?"
-    SQL Query: SELECT title, total_budget FROM incentives ORDER BY total_budget DESC LIMIT 5;
-
-    User Question: "Mostra-me empresas de Lisboa do setor da restauração."
-    SQL Query: SELECT company_name, english_trade_description FROM companies WHERE city LIKE '%Lisboa%' AND (cae_primary_label LIKE '%restauração%' OR cae_primary_label LIKE '%restaurant%');
-
-    User Question: "Quais as melhores empresas para o incentivo 'Apoio à Digitalização'?"
-    SQL Query: SELECT T2.company_name, T1.score FROM matches AS T1 JOIN companies AS T2 ON T1.company_nif = T2.nif_code JOIN incentives AS T3 ON T1.incentive_id = T3.incentive_id WHERE T3.title LIKE '%Apoio à Digitalização%' ORDER BY T1.score DESC LIMIT 10;
-    
-    User Question: "Quais as 5 melhores empresas para o incentivo 05/C13-i01/2023 PAE+S 2023 (1.º Aviso)?"
-    SQL Query: SELECT T2.company_name, T1.score FROM matches AS T1 JOIN companies AS T2 ON T1.company_nif = T2.nif_code JOIN incentives AS T3 ON T1.incentive_id = T3.incentive_id WHERE T3.title = '05/C13-i01/2023 PAE+S 2023 (1.º Aviso)' ORDER BY T1.score DESC LIMIT 5;
-
-    User Question: "delete all companies"
-    SQL Query: SELECT 'Data modification queries are not allowed.' AS error;
+{examples}
+"""
 
+def generate_sql_from_natural_language(query: str, db_schema: str) -> str:
+    """
+    Converts a user's natural language question into a safe SQLite query (NL2SQL).
+    """
+    question_prompt = f"""
     Now, convert the following user question into a single, valid SQLite `SELECT` query:
 
     User Question: "{query}"
     """
     try:
-        sql_generation_config = genai.types.GenerationConfig(
-            temperature=0.2,
-            top_p=1,
-            top_k=1,
-            max_output_tokens=4096,
-            response_mime_type="text/plain"
-        )
-
         response = model.generate_content(
-            prompt,
+            build_nl2sql_preamble(db_schema) + question_prompt,
             generation_config=sql_generation_config
         )
 
@@ -134,15 +270,32 @@ def generate_sql_from_natural_language(query: str, db_schema: str) -> str:
         return "SELECT 'An error occurred while generating the SQL query.' AS error;"
 
 
-def score_companies_for_incentive(incentive, companies_batch):
+def _is_valid_company_scores(scores) -> bool:
+    """True for a list of {"nif": ..., "score": <number>} objects, the only shape worth caching."""
+    return isinstance(scores, list) and all(
+        isinstance(item, dict) and 'nif' in item
+        and isinstance(item.get('score'), (int, float)) and not isinstance(item['score'], bool)
+        for item in scores
+    )
+
+async def score_companies_for_incentive(incentive, companies_batch):
     """
     Scores a batch of companies for an incentive using the LLM based on structured data.
     Returns a list of dictionaries with nif and score.
+    Scores are cached on disk per (objective, criteria, candidate NIFs), so re-runs
+    over unchanged incentives and candidates skip the LLM call entirely.
     """
     structured_data = json.loads(incentive.ai_description)
     object_text = structured_data['object']
     criterios = structured_data['criterios']
 
+    cache_key = hashlib.sha256(
+        f"{object_text}|{criterios}|{','.join(sorted(company.nif_code for company in companies_batch))}".encode()
+    ).hexdigest()
+    cached_scores = llm_cache.get(cache_key)
+    if _is_valid_company_scores(cached_scores):
+        return cached_scores
+
     companies_summary = [
         f"Company {company.nif_code}: {company.company_name}, CAE: {company.cae_primary_code}, City: {company.city}, Description: {company.english_trade_description}"
         for company in companies_batch
@@ -153,15 +306,18 @@ def score_companies_for_incentive(incentive, companies_batch):
 
     Criteria: {criterios}
 
+    Score each company below from 0 to 1 based on how well they match the incentive's objective and criteria.
+    Return a JSON list with nif and score, e.g., [{{"nif": "9050", "score": 0.8}}, ...]
+
     Companies:
     {chr(10).join([f"{i+1}. {summary}" for i, summary in enumerate(companies_summary)])}
-
-    Score each company from 0 to 1 based on how well they match the incentive's objective and criteria.
-    Return a JSON list with nif and score, e.g., [{{"nif": "9050", "score": 0.8}}, ...]
     """
     try:
-        response = model.generate_content(prompt)
+        response = await model.generate_content_async(prompt)
         scores = json.loads(response.text)
+        if not _is_valid_company_scores(scores):
+            raise ValueError(f"Unexpected scores format: {response.text[:200]}")
+        llm_cache.set(cache_key, scores, expire=LLM_CACHE_EXPIRE_SECONDS)
         return scores
     except Exception as e:
         print(f"Error scoring companies: {e}")
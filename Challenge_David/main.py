@@ -5,7 +5,8 @@ from database import create_database_and_tables, load_companies_from_csv, Sessio
 from scraper import run_scraper_and_processor
 from matching import find_and_store_matches
 from chatbot import app as fastapi_app
-from config import DB_FILE_NAME
+from semantic_cache import download_embedding_model
+from config import DB_FILE_NAME, EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_REPO
 
 COMPANY_CSV_PATH = 'companies_sample.csv'
 
@@ -39,6 +40,16 @@ def run_pipeline():
         db_session.close()
     print("--- Pipeline Complete ---")
 
+def download_chatbot_embedding_model():
+    """Downloads the local sentence embedder used by the chatbot's semantic SQL cache."""
+    print(f"\n--- Downloading embedding model '{EMBEDDING_ONNX_REPO}' to '{EMBEDDING_ONNX_DIR}' ---")
+    try:
+        download_embedding_model(EMBEDDING_ONNX_REPO, EMBEDDING_ONNX_DIR)
+    except Exception as e:
+        print(f"[ERROR] Failed to download the embedding model: {e}")
+        sys.exit(1)
+    print("--- Download Complete ---")
+
 def start_chatbot_server():
     """Starts the FastAPI server for the chatbot."""
     print("\n--- 5. Starting Chatbot API Server ---")
@@ -53,6 +64,7 @@ def print_usage():
     print("  setup    : Creates DB schema and loads company CSV. Run this first.")
     print("  pipeline : Scrapes incentives and runs the matching algorithm.")
     print("  chatbot  : Starts the API server for the chatbot.")
+    print("  embedding-model : Downloads the local embedding model used by the chatbot's SQL cache.")
     print("  all      : Runs 'setup', then 'pipeline', then starts the 'chatbot'.")
     print("\nExample: python main.py all\n")
 
@@ -69,6 +81,8 @@ if __name__ == "__main__":
         run_pipeline()
     elif command == 'chatbot':
         start_chatbot_server()
+    elif command == 'embedding-model':
+        download_chatbot_embedding_model()
     elif command == 'all':
         setup_initial_data()
         run_pipeline()
@@ -1,58 +1,149 @@
 import json
+import asyncio
+import numpy as np
+from numba import njit, prange
 from sqlalchemy.orm import Session
 from database import Incentive, Company, Match
-from llm_services import score_companies_for_incentive
+from llm_services import score_companies_for_incentive, run_llm_tasks
+from config import LLM_MAX_CONCURRENCY
+
+MATCH_WEIGHTS = {
+    'cae': 50,
+    'location': 30,
+    'size': 20
+}
+MAX_MATCH_SCORE = 100
+
+def _company_caes(company: Company) -> frozenset:
+    """Returns the set of primary and secondary CAE codes of a company."""
+    company_caes = {company.cae_primary_code}
+    if company.cae_secondary_codes:
+        company_caes.update(company.cae_secondary_codes.split())
+    return frozenset(company_caes)
 
-def calculate_match_score(incentive_details: dict, company: Company) -> float:
-    """
-    Objective Evaluation Metric: Calculates a match score between 0.0 and 1.0.
-    This function is deterministic, transparent, and tunable. It does NOT use an LLM,
-    making it fast and free to run for millions of company-incentive pairs.
-    """
-    score = 0
-    max_score = 100
-    weights = {
-        'cae': 50,
-        'location': 30,
-        'size': 20
-    }
-    
+def _parse_incentive_details(incentive_details: dict) -> tuple:
+    """Normalizes the CAE, location and dimension fields used by the rule-based score."""
     caes_value = incentive_details.get('caes')
     incentive_caes = set(caes_value) if isinstance(caes_value, list) else set()
-    company_caes = {company.cae_primary_code}
-    if company.cae_secondary_codes:
-        try:
-            company_caes.update(json.loads(company.cae_secondary_codes))
-        except (json.JSONDecodeError, TypeError):
-            pass
-    if not incentive_caes:
-        score += weights['cae']
-    elif company_caes.intersection(incentive_caes):
-        score += weights['cae']
 
     location_value = incentive_details.get('geographic_location')
     incentive_loc = location_value.lower() if isinstance(location_value, str) else ''
-    company_city = (company.city or "unknown").lower()
-    if "nacional" in incentive_loc or not incentive_loc:
-        score += weights['location']
-    elif company_city != "unknown" and company_city in incentive_loc:
-        score += weights['location']
 
     dimension_value = incentive_details.get('dimension')
     incentive_dim = dimension_value.lower() if isinstance(dimension_value, str) else 'não aplicável'
-    employees = company.latest_number_of_employees
-    is_pme = 0 < employees < 250
-    is_large = employees >= 250
+
+    return incentive_caes, incentive_loc, incentive_dim
+
+def _location_hit(incentive_loc: str, company_city: str) -> bool:
+    return company_city != "unknown" and company_city in incentive_loc
+
+def _size_hit(incentive_dim: str, is_pme, is_large):
+    """Works on plain booleans as well as on NumPy boolean arrays."""
     if 'não aplicável' in incentive_dim or not incentive_dim:
-        score += weights['size']
-    elif 'pme' in incentive_dim and 'grande' not in incentive_dim and is_pme:
-        score += weights['size']
-    elif 'grande' in incentive_dim and 'pme' not in incentive_dim and is_large:
-        score += weights['size']
-    elif 'pme' in incentive_dim and 'grande' in incentive_dim and (is_pme or is_large):
-        score += weights['size']
-            
-    return round(score / max_score, 4)
+        return True
+    if 'pme' in incentive_dim and 'grande' not in incentive_dim:
+        return is_pme
+    if 'grande' in incentive_dim and 'pme' not in incentive_dim:
+        return is_large
+    if 'pme' in incentive_dim and 'grande' in incentive_dim:
+        return is_pme | is_large
+    return False
+
+def build_company_arrays(companies: list) -> dict:
+    """
+    Preprocesses the companies once into column arrays (structure of arrays) so that
+    every incentive can be scored against all of them with vectorized operations.
+    """
+    cae_index = {}
+    for i, company in enumerate(companies):
+        for code in _company_caes(company):
+            cae_index.setdefault(code, []).append(i)
+
+    cities = [(company.city or "unknown").lower() for company in companies]
+    unique_cities, city_ids = np.unique(np.array(cities, dtype=str), return_inverse=True)
+
+    employees = np.fromiter(
+        (company.latest_number_of_employees or 0 for company in companies),
+        dtype=np.int32, count=len(companies)
+    )
+
+    return {
+        'count': len(companies),
+        'cae_index': {code: np.array(ids, dtype=np.intp) for code, ids in cae_index.items()},
+        'unique_cities': unique_cities.tolist(),
+        'city_ids': city_ids,
+        'is_pme': (employees > 0) & (employees < 250),
+        'is_large': employees >= 250,
+    }
+
+@njit(parallel=True, cache=True)
+def _score_kernel(cae_hit, loc_hit, size_hit, w_cae, w_loc, w_size, max_score, out):
+    for i in prange(out.shape[0]):
+        out[i] = (cae_hit[i] * w_cae + loc_hit[i] * w_loc + size_hit[i] * w_size) / max_score
+
+def calculate_match_scores(incentive_details: dict, company_arrays: dict) -> np.ndarray:
+    """
+    Vectorized equivalent of calculate_match_score: scores one incentive against
+    every company in the preprocessed arrays and returns one score per company.
+    The per-rule hits are computed here and combined by a compiled kernel.
+    """
+    incentive_caes, incentive_loc, incentive_dim = _parse_incentive_details(incentive_details)
+    count = company_arrays['count']
+
+    if incentive_caes:
+        cae_hit = np.zeros(count, dtype=np.uint8)
+        for code in incentive_caes:
+            ids = company_arrays['cae_index'].get(code)
+            if ids is not None:
+                cae_hit[ids] = 1
+    else:
+        cae_hit = np.ones(count, dtype=np.uint8)
+
+    if "nacional" in incentive_loc or not incentive_loc:
+        loc_hit = np.ones(count, dtype=np.uint8)
+    else:
+        city_hit = np.array(
+            [_location_hit(incentive_loc, city) for city in company_arrays['unique_cities']],
+            dtype=np.uint8
+        )
+        loc_hit = city_hit[company_arrays['city_ids']]
+
+    size_hit = _size_hit(incentive_dim, company_arrays['is_pme'], company_arrays['is_large'])
+    size_hit = np.broadcast_to(np.asarray(size_hit, dtype=np.uint8), (count,))
+
+    scores = np.empty(count, dtype=np.float64)
+    _score_kernel(
+        cae_hit, loc_hit, np.ascontiguousarray(size_hit),
+        MATCH_WEIGHTS['cae'], MATCH_WEIGHTS['location'], MATCH_WEIGHTS['size'],
+        MAX_MATCH_SCORE, scores
+    )
+    return np.round(scores, 4)
+
+def calculate_match_score(incentive_details: dict, company: Company) -> float:
+    """
+    Objective Evaluation Metric: Calculates a match score between 0.0 and 1.0.
+    This function is deterministic, transparent, and tunable. It does NOT use an LLM,
+    making it fast and free to run for millions of company-incentive pairs.
+    Single-pair wrapper around calculate_match_scores.
+    """
+    return float(calculate_match_scores(incentive_details, build_company_arrays([company]))[0])
+
+async def score_candidates_with_llm(candidate_pairs: list) -> list:
+    """
+    Scores every (incentive, candidate companies) pair with the LLM concurrently,
+    keeping at most LLM_MAX_CONCURRENCY requests in flight.
+    Results are returned in the same order as the pairs; failed requests are returned as exceptions.
+    """
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+    async def score(incentive, companies_batch):
+        async with semaphore:
+            return await score_companies_for_incentive(incentive, companies_batch)
+
+    return await asyncio.gather(
+        *(score(incentive, companies_batch) for incentive, companies_batch in candidate_pairs),
+        return_exceptions=True
+    )
 
 def find_and_store_matches(db: Session, k: int = 5):
     """
@@ -70,14 +161,13 @@ def find_and_store_matches(db: Session, k: int = 5):
         print("Not enough data to perform matching. Please run scraper and load companies first.")
         return
 
-    print("Clearing old matches from the database...")
-    db.query(Match).delete()
-    db.commit()
+    company_arrays = build_company_arrays(companies)
 
     N = 50
     MIN_RULE_SCORE = 0.1
 
-    total_matches_found = 0
+    all_matches = []
+    candidate_pairs = []
 
     for incentive in incentives:
         print(f"\n-> Matching for incentive: '{incentive.title}'")
@@ -87,31 +177,54 @@ def find_and_store_matches(db: Session, k: int = 5):
             print(f"  [!] Could not parse AI description for this incentive. Skipping.")
             continue
 
-        scores = [(company, calculate_match_score(incentive_details, company)) for company in companies]
-        filtered_scores = [item for item in scores if item[1] > MIN_RULE_SCORE]
-        top_n = sorted(filtered_scores, key=lambda x: x[1], reverse=True)[:N]
-        top_n_companies = [company for company, _ in top_n]
+        scores = calculate_match_scores(incentive_details, company_arrays)
+        candidates = np.flatnonzero(scores > MIN_RULE_SCORE)
+        if candidates.size > N:
+            # Keep every candidate above the N-th best score, then the first tied ones in table order,
+            # so the selection matches sorted(...)[:N] without sorting all candidates.
+            candidate_scores = scores[candidates]
+            kth_score = np.partition(candidate_scores, candidates.size - N)[candidates.size - N]
+            above = candidate_scores > kth_score
+            tied = np.flatnonzero(candidate_scores == kth_score)[:N - np.count_nonzero(above)]
+            candidates = np.sort(np.concatenate((candidates[above], candidates[tied])))
+        top_n = candidates[np.argsort(-scores[candidates], kind='stable')]
+        top_n_companies = [companies[i] for i in top_n]
 
         if not top_n_companies:
             print("  No companies meet the minimum rule-based score for this incentive.")
             continue
 
-        print(f"  Scoring top {len(top_n_companies)} companies with LLM...")
-        llm_scores = score_companies_for_incentive(incentive, top_n_companies)
+        print(f"  Selected top {len(top_n_companies)} companies for LLM scoring.")
+        candidate_pairs.append((incentive, top_n_companies))
+
+    print(f"\nScoring candidates for {len(candidate_pairs)} incentives with LLM...")
+    results = run_llm_tasks(score_candidates_with_llm(candidate_pairs))
+
+    for (incentive, _), llm_scores in zip(candidate_pairs, results):
+        print(f"\n-> LLM matches for incentive: '{incentive.title}'")
+        if isinstance(llm_scores, Exception):
+            print(f"  [!] LLM scoring failed for this incentive: {llm_scores}")
+            continue
 
         if llm_scores:
             llm_scores_filtered = [item for item in llm_scores if float(item['score']) > 0.00]
             top_k_scores = sorted(llm_scores_filtered, key=lambda x: float(x['score']), reverse=True)[:k]
             for item in top_k_scores:
-                match = Match(incentive_id=incentive.incentive_id, company_nif=item['nif'], score=float(item['score']))
-                db.add(match)
-                total_matches_found += 1
+                all_matches.append({
+                    'incentive_id': incentive.incentive_id,
+                    'company_nif': item['nif'],
+                    'score': float(item['score'])
+                })
                 print(f"    - Company NIF: {item['nif']}, Score: {float(item['score']):.2f}")
         else:
             print("  No LLM scores returned for this incentive.")
 
+    print("\nReplacing old matches in the database...")
+    db.execute(Match.__table__.delete())
+    if all_matches:
+        db.execute(Match.__table__.insert(), all_matches)
     db.commit()
-    print(f"\n--- Matching process complete. Stored {total_matches_found} new matches. ---")
+    print(f"\n--- Matching process complete. Stored {len(all_matches)} new matches. ---")
 
 if __name__ == "__main__":
     from database import create_database_and_tables, SessionLocal
@@ -1,6 +1,15 @@
+import os
+import re
 import time
+import shutil
 import json
-from datetime import datetime
+import orjson
+import random
+import asyncio
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from datetime import date
 from urllib.parse import urljoin
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -10,66 +19,98 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-from database import Incentive, SessionLocal
-from llm_services import generate_structured_data_for_incentive
+import lxml.html
+import lxml.etree
+import httpx
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import Incentive, PageCache, SessionLocal
+from llm_services import generate_structured_data_for_incentive, content_hash, run_llm_tasks
+from config import (
+    SCRAPER_MAX_WORKERS, SCRAPER_HTTP_MAX_CONNECTIONS, SCRAPER_COMMIT_BATCH_SIZE,
+    LINKS_CACHE_PATH, LINKS_CACHE_TTL_SECONDS, LLM_MAX_CONCURRENCY
+)
 
 BASE_URL = "https://www.fundoambiental.pt"
 TOP_LEVEL_MENU_TEXT = "Apoios PRR"
+CONTENT_AREA_ID = "ctAreaConteudo"
+DOCUMENT_PATH_MARKER = "ficheiros/"
+# Visible text of the content area (what BeautifulSoup's get_text returned) and its document links.
+CONTENT_AREA_XPATH = f'//*[@id="{CONTENT_AREA_ID}"]'
+CONTENT_TEXT_XPATH = ".//text()[not(parent::script) and not(parent::style)]"
+DOCUMENT_LINK_XPATH = f".//a[contains(@href, '{DOCUMENT_PATH_MARKER}')]/@href"
+# Serialized in the page and returned in one call, instead of through the WebDriver attribute endpoint.
+CONTENT_AREA_HTML_SCRIPT = f"const area = document.getElementById('{CONTENT_AREA_ID}'); return area ? area.outerHTML : null;"
+MAIN_MENU_LINKS_SELECTOR = "div#navbar > ul > li > a"
+
+# Locators and wait conditions are built once; the conditions are stateless and reused on every page.
+COOKIE_BUTTON_LOCATOR = (By.ID, "CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll")
+MAIN_MENU_LOCATOR = (By.CSS_SELECTOR, MAIN_MENU_LINKS_SELECTOR)
+CONTENT_AREA_LOCATOR = (By.ID, CONTENT_AREA_ID)
+TITLE_LOCATOR = (By.TAG_NAME, "h1")
+WAIT_FOR_COOKIE_BUTTON = EC.element_to_be_clickable(COOKIE_BUTTON_LOCATOR)
+WAIT_FOR_MAIN_MENU = EC.presence_of_element_located(MAIN_MENU_LOCATOR)
+WAIT_FOR_CONTENT_AREA = EC.presence_of_element_located(CONTENT_AREA_LOCATOR)
+WAIT_FOR_TITLE = EC.visibility_of_element_located(TITLE_LOCATOR)
+
+# Finds the top-level menu link by its visible text in one call and returns [link, its <li>, the <li>'s dropdown <ul>].
+TOP_MENU_SCRIPT = """
+const link = Array.from(document.querySelectorAll(arguments[0])).find(a => a.innerText.trim() === arguments[1]);
+return link ? [link, link.parentElement, link.parentElement.querySelector('ul')] : null;
+"""
+# Incentive links inside the second-level dropdowns of a top-level menu <li> (arguments[0]).
+SUBMENU_LINKS_SCRIPT = """
+return Array.from(arguments[0].querySelectorAll(':scope > ul li ul a[href]'))
+    .map(a => a.href)
+    .filter(href => href.startsWith(arguments[1]) && href.includes('.aspx'));
+"""
+XML_DECLARATION_ENCODING = re.compile(rb'\s*<\?xml[^>]*\bencoding=["\']([\w.:-]+)["\']')
+# Marks a page the server reported as unchanged (HTTP 304) since its validators were stored.
+PAGE_NOT_MODIFIED = object()
+INCENTIVE_DATE_FIELDS = ("publication_date", "start_date", "end_date")
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"}
 
 def get_all_incentive_links_from_category(driver, wait):
     """
     Navigates to the top-level menu, hovers over it to reveal sublinks,
     and collects all incentive URLs from second-level dropdowns under the category.
+    The menu item and its dropdown links are each looked up in the browser with one
+    execute_script call rather than one WebDriver round-trip per menu item and link.
     """
     links_to_visit = set()
     print(f"--- Searching for all incentive links under category: '{TOP_LEVEL_MENU_TEXT}' ---")
     try:
         driver.get(BASE_URL)
         try:
-            cookie_button = wait.until(EC.element_to_be_clickable((By.ID, "CybotCookiebotDialogBodyLevelButtonLevelOptinAllowAll")))
+            cookie_button = wait.until(WAIT_FOR_COOKIE_BUTTON)
             cookie_button.click()
             print("Cookie policy accepted.")
         except TimeoutException:
             print("Cookie banner not found or already accepted.")
 
         actions = ActionChains(driver)
-        main_menu_links = wait.until(EC.presence_of_all_elements_located((By.CSS_SELECTOR, "div#navbar > ul > li > a")))
-        top_menu_link = next((link for link in main_menu_links if link.text.strip() == TOP_LEVEL_MENU_TEXT), None)
-        
-        if not top_menu_link:
+        wait.until(WAIT_FOR_MAIN_MENU)
+        top_menu = driver.execute_script(TOP_MENU_SCRIPT, MAIN_MENU_LINKS_SELECTOR, TOP_LEVEL_MENU_TEXT)
+
+        if not top_menu:
             raise NoSuchElementException(f"Could not find menu item '{TOP_LEVEL_MENU_TEXT}'")
+        top_menu_link, parent_li, dropdown_ul = top_menu
+        if dropdown_ul is None:
+            raise NoSuchElementException(f"Menu item '{TOP_LEVEL_MENU_TEXT}' has no dropdown")
 
         print(f"  Hovering over menu '{TOP_LEVEL_MENU_TEXT}' to reveal sublinks...")
         actions.move_to_element(top_menu_link).perform()
-        time.sleep(2)
+        try:
+            wait.until(EC.visibility_of(dropdown_ul))
+        except TimeoutException:
+            print(f"  [WARNING] Dropdown of '{TOP_LEVEL_MENU_TEXT}' did not become visible. Reading its links anyway.")
 
-        parent_li = top_menu_link.find_element(By.XPATH, "./..")
-        dropdown_ul = parent_li.find_element(By.TAG_NAME, "ul")
-        first_level_lis = dropdown_ul.find_elements(By.TAG_NAME, "li")
-
-        for li in first_level_lis:
-            try:
-                submenu_ul = li.find_element(By.TAG_NAME, "ul")
-                sublink_a = li.find_element(By.TAG_NAME, "a")
-                sublink_text = sublink_a.text.strip()
-                print(f"    Hovering over sublink '{sublink_text}' to reveal its dropdown...")
-                actions.move_to_element(sublink_a).perform()
-                time.sleep(1)
-
-                submenu_links = submenu_ul.find_elements(By.TAG_NAME, "a")
-                for link in submenu_links:
-                    href = link.get_attribute('href')
-                    if href and href.startswith(BASE_URL) and ".aspx" in href:
-                        links_to_visit.add(href)
-                        print(f"      Added incentive link: {href}")
-            except NoSuchElementException:
-                try:
-                    sublink_a = li.find_element(By.TAG_NAME, "a")
-                    print(f"    Skipping sublink '{sublink_a.text.strip()}' (no submenu).")
-                except NoSuchElementException:
-                    print("    Skipping an invalid sublink (no <a> or <ul>).")
-                continue
+        hrefs = driver.execute_script(SUBMENU_LINKS_SCRIPT, parent_li, BASE_URL)
+        for href in hrefs:
+            if href not in links_to_visit:
+                links_to_visit.add(href)
+                print(f"      Added incentive link: {href}")
 
         print(f"Found {len(links_to_visit)} unique incentive links to process.")
         return list(links_to_visit)
@@ -78,13 +119,54 @@ def get_all_incentive_links_from_category(driver, wait):
         print(f"[FATAL ERROR] Could not navigate the menu: {e}")
         return []
 
-def run_scraper_and_processor():
+# Chrome content settings that stop detail pages from downloading assets the scraper never reads.
+ASSET_BLOCKING_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.stylesheets": 2,
+}
+
+def load_cached_incentive_links():
+    """Returns the incentive links found by a recent menu discovery run, or None if there are none."""
+    if not os.path.exists(LINKS_CACHE_PATH):
+        return None
+    if time.time() - os.path.getmtime(LINKS_CACHE_PATH) >= LINKS_CACHE_TTL_SECONDS:
+        return None
+    try:
+        with open(LINKS_CACHE_PATH, encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] Could not read the links cache: {e}")
+        return None
+    if not isinstance(cached, dict) or cached.get("base_url") != BASE_URL or not cached.get("links"):
+        return None
+    return cached["links"]
+
+def save_incentive_links(links: list):
+    """Persists the discovered incentive links so reruns within the TTL skip menu discovery."""
+    try:
+        with open(LINKS_CACHE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"base_url": BASE_URL, "links": links}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"[WARNING] Could not write the links cache: {e}")
+
+@lru_cache(maxsize=None)
+def resolve_chromedriver_path() -> str:
     """
-    Orchestrates scraping, AI processing, and database storage.
+    Finds the chromedriver binary once per process: the CHROMEDRIVER environment variable,
+    then a chromedriver on the PATH, and only then webdriver-manager (which checks versions over the network).
     """
-    print("--- Starting Advanced Scraper with Menu Navigation ---")
+    driver_path = os.environ.get("CHROMEDRIVER") or shutil.which("chromedriver")
+    if driver_path:
+        return driver_path
+    return ChromeDriverManager().install()
 
-    service = Service(ChromeDriverManager().install())
+def create_chrome_driver(block_assets: bool = False):
+    """
+    Creates a headless Chrome WebDriver.
+    With block_assets, images and stylesheets are not loaded and driver.get returns at
+    DOMContentLoaded; only use it for pages that are read, not hovered (the menu needs its CSS).
+    """
+    service = Service(resolve_chromedriver_path())
     options = webdriver.ChromeOptions()
     options.add_argument("--headless")
     options.add_argument("--no-sandbox")
@@ -93,103 +175,327 @@ def run_scraper_and_processor():
     options.add_argument("--window-size=1920,1080")
     options.add_argument("--disable-gpu")
     options.add_argument("--disable-extensions")
-    driver = webdriver.Chrome(service=service, options=options)
-    wait = WebDriverWait(driver, 20)
+    if block_assets:
+        options.add_experimental_option("prefs", ASSET_BLOCKING_PREFS)
+        options.page_load_strategy = "eager"
+    return webdriver.Chrome(service=service, options=options)
 
-    db = SessionLocal()
+def _title_from_url(url: str) -> str:
+    return url.split('/')[-1].replace('.aspx', '')
+
+def _extract_page_parts(page_html, url: str, encoding: str = None):
+    """
+    Returns (title, content_html) from the HTML of an incentive page (str, or bytes in the given
+    or declared encoding), or None when the page has no content area.
+    """
+    tree = lxml.html.fromstring(page_html, parser=lxml.html.HTMLParser(encoding=encoding) if encoding else None)
+    content_areas = tree.xpath(CONTENT_AREA_XPATH)
+    if not content_areas:
+        return None
+    headings = tree.xpath('//h1')
+    title = headings[0].text_content().strip() if headings else ""
+    if not title:
+        print("  [WARNING] Could not find a title on the page. Using URL as title.")
+        title = _title_from_url(url)
+    return title, lxml.html.tostring(content_areas[0], encoding='unicode', with_tail=False)
+
+async def _fetch_page(client: httpx.AsyncClient, url: str, validators: tuple):
+    """Returns (page, (etag, last_modified)) for one conditional GET."""
+    etag, last_modified = validators or (None, None)
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        response = await client.get(url, headers=headers)
+        if response.status_code == 304:
+            return PAGE_NOT_MODIFIED, validators
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"  [WARNING] HTTP fetch failed for {url}: {e}")
+        return None, None
     try:
-        incentive_urls = get_all_incentive_links_from_category(driver, wait)
-        if not incentive_urls:
-            print("No incentive URLs found. Terminating scraper.")
-            return
+        # Bytes are decoded by lxml with the HTTP charset, else the <?xml?> declaration, else the page's <meta>.
+        declaration = XML_DECLARATION_ENCODING.match(response.content)
+        encoding = response.charset_encoding or (declaration.group(1).decode("ascii") if declaration else None)
+        page = _extract_page_parts(response.content, url, encoding)
+    except (lxml.etree.LxmlError, LookupError, ValueError) as e:
+        print(f"  [WARNING] Could not parse the HTML of {url}: {e}. Falling back to Selenium.")
+        return None, None
+    return page, (response.headers.get("ETag"), response.headers.get("Last-Modified"))
 
-        for url in incentive_urls:
-            print(f"\n--- Processing URL: {url} ---")
-            driver.get(url)
-            time.sleep(2)
+async def fetch_pages_with_httpx(urls: list, known_validators: dict) -> tuple:
+    """
+    Fetches all incentive pages concurrently over plain HTTP (the content area is static HTML).
+    Pages with stored validators are requested conditionally and come back as PAGE_NOT_MODIFIED on a 304.
+    Returns ({url: (title, content_html), PAGE_NOT_MODIFIED or None}, {url: (etag, last_modified)});
+    None marks pages that need the browser fallback.
+    """
+    limits = httpx.Limits(max_connections=SCRAPER_HTTP_MAX_CONNECTIONS)
+    async with httpx.AsyncClient(
+        http2=True, follow_redirects=True, timeout=20, limits=limits, headers=HTTP_HEADERS
+    ) as client:
+        results = await asyncio.gather(*(_fetch_page(client, url, known_validators.get(url)) for url in urls))
+    pages = {url: page for url, (page, _) in zip(urls, results)}
+    validators = {url: page_validators for url, (_, page_validators) in zip(urls, results) if page_validators and any(page_validators)}
+    return pages, validators
 
-            try:
-                wait.until(EC.presence_of_element_located((By.ID, "ctAreaConteudo")))
-            except TimeoutException:
-                print("  [WARNING] Content area not loaded in time. Skipping.")
-                continue
+_worker_driver = None
+_worker_wait = None
 
-            title = None
-            try:
-                title_element = wait.until(EC.visibility_of_element_located((By.TAG_NAME, "h1")))
-                title = title_element.text.strip()
-            except TimeoutException:
-                print("  [WARNING] Could not find a title on the page. Using URL as title.")
-                title = url.split('/')[-1].replace('.aspx', '')
-
-            if db.query(Incentive).filter_by(title=title).first():
-                print(f"  Incentive '{title}' already exists in the database. Skipping.")
-                continue
+def _init_scraper_worker():
+    """
+    Runs once in every Selenium fallback worker. Selenium is not thread-safe, so each
+    process gets its own Chrome session, reused for all of its URLs.
+    """
+    global _worker_driver, _worker_wait
+    _worker_driver = create_chrome_driver(block_assets=True)
+    _worker_wait = WebDriverWait(_worker_driver, 20)
+    Finalize(None, _worker_driver.quit, exitpriority=10)
+
+def fetch_page_with_selenium(url: str):
+    """
+    Renders one incentive page in a worker's browser.
+    Returns (title, content_html), or None if the page could not be loaded.
+    """
+    driver, wait = _worker_driver, _worker_wait
+    try:
+        time.sleep(random.randint(1, 10) * 0.1)
+        print(f"  Rendering {url} with Selenium...")
+        driver.get(url)
+
+        try:
+            wait.until(WAIT_FOR_CONTENT_AREA)
+        except TimeoutException:
+            print(f"  [WARNING] Content area not loaded in time. Skipping {url}.")
+            return None
+
+        try:
+            title_element = wait.until(WAIT_FOR_TITLE)
+            title = title_element.text.strip()
+        except TimeoutException:
+            print("  [WARNING] Could not find a title on the page. Using URL as title.")
+            title = _title_from_url(url)
 
-            full_text, document_urls_str = "", ""
+        content_html = driver.execute_script(CONTENT_AREA_HTML_SCRIPT)
+        if content_html is None:
+            print(f"  [!] Error locating content area on {url}. Skipping.")
+            return None
+        return title, content_html
+    except Exception as e:
+        print(f"  [!] Unexpected error while rendering {url}: {e}")
+    return None
+
+def extract_incentive_page(url: str, title: str, content_html: str, seen_titles: set):
+    """
+    Extracts the text and document links of a fetched incentive page.
+    Returns the page's 'incentives' columns that do not depend on the LLM, or None if it is skipped.
+    A title already processed in this run (seen_titles) is skipped.
+    """
+    print(f"\n--- Processing URL: {url} ---")
+    if title in seen_titles:
+        print(f"  Incentive '{title}' was already processed in this run. Skipping.")
+        return None
+
+    try:
+        content_tree = lxml.html.fragment_fromstring(content_html, create_parent=True)
+        full_text = "\n".join(
+            text.strip() for text in content_tree.xpath(CONTENT_TEXT_XPATH) if text.strip()
+        )
+        doc_links = [urljoin(BASE_URL, href) for href in content_tree.xpath(DOCUMENT_LINK_XPATH)]
+        print(f"  Found {len(doc_links)} document links on {url}.")
+    except Exception as e:
+        print(f"  [!] Unexpected error extracting details: {e}. Skipping.")
+        return None
+
+    seen_titles.add(title)
+    return dict(
+        title=title,
+        description=full_text,
+        document_urls=",".join(doc_links),
+        source_link=url,
+        content_hash=content_hash(full_text)
+    )
+
+async def extract_structured_data_with_llm(texts: list) -> list:
+    """
+    Structures every page text with the LLM concurrently, keeping at most
+    LLM_MAX_CONCURRENCY requests in flight. Results are returned in the same order as the texts.
+    """
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+    async def extract(text):
+        async with semaphore:
+            return await generate_structured_data_for_incentive(text)
+
+    return await asyncio.gather(*(extract(text) for text in texts))
+
+def build_incentive_row(page: dict, ai_generated_json: dict) -> dict:
+    """Completes an extracted page with the fields parsed from its AI description."""
+    parsed_dates = {}
+    for field in INCENTIVE_DATE_FIELDS:
+        value = ai_generated_json.get(field)
+        try:
+            parsed_dates[field] = date.fromisoformat(value) if value else None
+        except (TypeError, ValueError):
+            print(f"  [WARNING] Invalid {field} format for '{page['title']}'. Setting to None.")
+            parsed_dates[field] = None
+
+    return dict(
+        page,
+        ai_description=orjson.dumps(ai_generated_json).decode(),
+        **parsed_dates,
+        total_budget=ai_generated_json.get('total_budget')
+    )
+
+def save_incentives(db: Session, new_incentives: list, changed_incentives: list, page_cache_rows: list):
+    """
+    Saves a batch of processed incentive rows with one prepared INSERT and a single commit.
+    Titles that are already stored are ignored by the database (ON CONFLICT DO NOTHING).
+    Stored incentives whose page content changed are updated in place by title, keeping their id and matches.
+    The HTTP validators of the batch's pages are written in the same transaction, so a page
+    is only ever skipped on a 304 once its incentive is stored.
+    """
+    if not new_incentives and not changed_incentives and not page_cache_rows:
+        return
+    try:
+        inserted = 0
+        if new_incentives:
+            stmt = sqlite_insert(Incentive.__table__).on_conflict_do_nothing(index_elements=['title'])
+            inserted = db.execute(stmt, new_incentives).rowcount
+        if changed_incentives:
+            table = Incentive.__table__
+            stmt = update(table).where(table.c.title == bindparam('stored_title')).values(
+                {column: bindparam(column) for column in changed_incentives[0] if column != 'title'}
+            )
+            db.execute(stmt, [dict(row, stored_title=row['title']) for row in changed_incentives])
+        if page_cache_rows:
+            stmt = sqlite_insert(PageCache.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['url'],
+                set_={column: stmt.excluded[column] for column in ('etag', 'last_modified')}
+            )
+            db.execute(stmt, page_cache_rows)
+        db.commit()
+        if new_incentives:
+            skipped = len(new_incentives) - inserted
+            print(f"  Saved {inserted} incentives to the database" + (f" ({skipped} already stored)." if skipped else "."))
+        if changed_incentives:
+            print(f"  Updated {len(changed_incentives)} incentives whose page content changed.")
+    except Exception as e:
+        db.rollback()
+        print(f"  [ERROR] Failed to save a batch of {len(new_incentives) + len(changed_incentives)} incentives: {e}")
+
+def run_scraper_and_processor():
+    """
+    Orchestrates scraping, AI processing, and database storage.
+    A single Selenium session discovers the incentive links (the menu needs JS);
+    the incentive pages themselves are fetched concurrently with httpx, and only pages
+    whose content area is missing from the static HTML are rendered by a pool of
+    Selenium worker processes. Once every page is parsed, the new texts are structured
+    by the LLM in one concurrent phase before the rows are saved.
+    """
+    print("--- Starting Advanced Scraper with Menu Navigation ---")
+
+    incentive_urls = load_cached_incentive_links()
+    if incentive_urls:
+        print(f"Using {len(incentive_urls)} incentive links cached in '{LINKS_CACHE_PATH}'.")
+    else:
+        driver = create_chrome_driver()
+        try:
+            incentive_urls = get_all_incentive_links_from_category(driver, WebDriverWait(driver, 20))
+        finally:
+            driver.quit()
+        if incentive_urls:
+            save_incentive_links(incentive_urls)
+
+    if not incentive_urls:
+        print("No incentive URLs found. Terminating scraper.")
+        return
+
+    db = SessionLocal()
+    try:
+        known_validators = {
+            url: (etag, last_modified)
+            for url, etag, last_modified in db.execute(select(PageCache.url, PageCache.etag, PageCache.last_modified))
+        }
+        print(f"--- Fetching {len(incentive_urls)} incentive pages over HTTP ---")
+        pages, validators = asyncio.run(fetch_pages_with_httpx(incentive_urls, known_validators))
+        unchanged_urls = [url for url, page in pages.items() if page is PAGE_NOT_MODIFIED]
+        if unchanged_urls:
+            print(f"  {len(unchanged_urls)} pages are unchanged since the last run (HTTP 304). Skipping them.")
+
+        fallback_urls = [url for url, page in pages.items() if page is None]
+        if fallback_urls:
+            print(f"--- Rendering {len(fallback_urls)} pages with Selenium ---")
             try:
-                content_area = driver.find_element(By.ID, "ctAreaConteudo")
-                detail_soup = BeautifulSoup(content_area.get_attribute('outerHTML'), 'html.parser')
-                full_text = detail_soup.get_text(separator='\n', strip=True)
-                doc_links = [
-                    urljoin(BASE_URL, a['href']) 
-                    for a in detail_soup.find_all('a', href=True) 
-                    if 'ficheiros/' in a['href']
-                ]
-                document_urls_str = ",".join(doc_links)
-                print(f"  Found {len(doc_links)} document links.")
-            except NoSuchElementException as e:
-                print(f"  [!] Error locating content area: {e}. Skipping.")
-                continue
+                resolve_chromedriver_path()  # resolved once here; forked workers inherit the cached path
+                with ProcessPoolExecutor(
+                    max_workers=min(SCRAPER_MAX_WORKERS, len(fallback_urls)),
+                    initializer=_init_scraper_worker
+                ) as executor:
+                    for url, page in zip(fallback_urls, executor.map(fetch_page_with_selenium, fallback_urls)):
+                        pages[url] = page
             except Exception as e:
-                print(f"  [!] Unexpected error extracting details: {e}. Skipping.")
+                print(f"  [ERROR] Selenium fallback failed: {e}. Continuing with the pages fetched so far.")
+
+        stored_hashes = dict(db.execute(select(Incentive.title, Incentive.content_hash)).all())
+        seen_titles = set()
+        known_content = dict(db.execute(
+            select(Incentive.content_hash, Incentive.ai_description).where(Incentive.content_hash.is_not(None))
+        ).all())
+        extracted_pages = []
+        for url in incentive_urls:
+            page_parts = pages.pop(url, None)
+            if page_parts is None or page_parts is PAGE_NOT_MODIFIED:
                 continue
+            title, content_html = page_parts
+            page = extract_incentive_page(url, title, content_html, seen_titles)
+            is_stored = title in stored_hashes
+            if page is not None and is_stored:
+                if page["content_hash"] == stored_hashes[title]:
+                    print(f"  Content of '{title}' is unchanged since it was stored. Skipping.")
+                    page = None
+                else:
+                    print(f"  Content of '{title}' changed since it was stored. Updating it.")
+            page_cache_row = None
+            if url in validators and (is_stored or title in seen_titles):
+                etag, last_modified = validators[url]
+                page_cache_row = {"url": url, "etag": etag, "last_modified": last_modified}
+            extracted_pages.append((page, is_stored, page_cache_row))
 
-            print("  Extracting structured data with AI...")
-            ai_generated_json = generate_structured_data_for_incentive(full_text)
-
-            publication_date = None
-            start_date = None
-            end_date = None
-            total_budget = None
-            if 'publication_date' in ai_generated_json and ai_generated_json['publication_date']:
-                try:
-                    publication_date = datetime.strptime(ai_generated_json['publication_date'], "%Y-%m-%d").date()
-                except ValueError:
-                    print("  [WARNING] Invalid publication_date format. Setting to None.")
-            if 'start_date' in ai_generated_json and ai_generated_json['start_date']:
-                try:
-                    start_date = datetime.strptime(ai_generated_json['start_date'], "%Y-%m-%d").date()
-                except ValueError:
-                    print("  [WARNING] Invalid start_date format. Setting to None.")
-            if 'end_date' in ai_generated_json and ai_generated_json['end_date']:
-                try:
-                    end_date = datetime.strptime(ai_generated_json['end_date'], "%Y-%m-%d").date()
-                except ValueError:
-                    print("  [WARNING] Invalid end_date format. Setting to None.")
-            total_budget = ai_generated_json.get('total_budget')
-
-            new_incentive = Incentive(
-                title=title,
-                description=full_text,
-                ai_description=json.dumps(ai_generated_json, ensure_ascii=False),
-                document_urls=document_urls_str,
-                publication_date=publication_date,
-                start_date=start_date,
-                end_date=end_date,
-                total_budget=total_budget,
-                source_link=url
-            )
-            db.add(new_incentive)
-            db.commit()
-            print(f"  Successfully processed and saved: '{title}'")
+        texts_to_extract = {}
+        for page, _, _ in extracted_pages:
+            if page is None:
+                continue
+            if page["content_hash"] in known_content:
+                print(f"  Content of '{page['title']}' is unchanged from a stored incentive. Reusing its AI description.")
+            else:
+                texts_to_extract.setdefault(page["content_hash"], page["description"])
+        extracted = {}
+        if texts_to_extract:
+            print(f"\n--- Extracting structured data with AI for {len(texts_to_extract)} pages ---")
+            extracted = dict(zip(
+                texts_to_extract,
+                run_llm_tasks(extract_structured_data_with_llm(list(texts_to_extract.values())))
+            ))
 
-            time.sleep(1)
+        new_incentives, changed_incentives, page_cache_rows = [], [], []
+        for page, is_stored, page_cache_row in extracted_pages:
+            if page is not None:
+                page_hash = page["content_hash"]
+                ai_generated_json = extracted[page_hash] if page_hash in extracted else orjson.loads(known_content[page_hash])
+                (changed_incentives if is_stored else new_incentives).append(build_incentive_row(page, ai_generated_json))
+            if page_cache_row is not None:
+                page_cache_rows.append(page_cache_row)
+            if len(new_incentives) + len(changed_incentives) >= SCRAPER_COMMIT_BATCH_SIZE:
+                save_incentives(db, new_incentives, changed_incentives, page_cache_rows)
+                new_incentives, changed_incentives, page_cache_rows = [], [], []
+        save_incentives(db, new_incentives, changed_incentives, page_cache_rows)
 
     except Exception as e:
         print(f"\n[FATAL ERROR], Unexpected error during scraping: {e}")
-        db.rollback()
     finally:
         print("\n--- Scraping process completed. ---")
-        driver.quit()
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,205 @@
+import json
+import os
+import re
+import shutil
+import threading
+from functools import lru_cache
+import numpy as np
+import faiss
+import onnxruntime as ort
+from tokenizers import Tokenizer
+from huggingface_hub import hf_hub_download
+
+NUMBER_PATTERN = re.compile(r"\d+")
+QUOTED_PATTERN = re.compile(r"'([^']+)'|\"([^\"]+)\"")
+SQL_STRING_LITERAL_PATTERN = re.compile(r"'([^']*)'")
+WORD_PATTERN = re.compile(r"\w+")
+
+def _words(text: str) -> set:
+    return set(WORD_PATTERN.findall(text.lower()))
+
+def literals_match(query: str, cached_query: str, cached_sql: str) -> bool:
+    """
+    Checks that a semantically similar cached question asked for the same values as the query.
+    Embeddings barely separate "Lisboa" from "Porto" or "5" from "10", so both questions must
+    contain the same numbers, the query's quoted terms and capitalized names must appear in the
+    cached SQL, and the words the cached question bound into SQL string literals must appear in the query.
+    """
+    if set(NUMBER_PATTERN.findall(query)) != set(NUMBER_PATTERN.findall(cached_query)):
+        return False
+
+    sql = cached_sql.lower()
+    terms = [single or double for single, double in QUOTED_PATTERN.findall(query)]
+    terms += [word for word in query.split()[1:] if word[:1].isupper()]
+    if any(not all(word in sql for word in _words(term)) for term in terms):
+        return False
+
+    bound_words = _words(" ".join(SQL_STRING_LITERAL_PATTERN.findall(cached_sql))) & _words(cached_query)
+    return bound_words <= _words(query)
+
+# Files of the sentence-transformers Hub repository that OnnxEmbedder needs, as (remote path, local name).
+ONNX_MODEL_FILES = [("onnx/model.onnx", "model.onnx"), ("tokenizer.json", "tokenizer.json")]
+
+def download_embedding_model(repo_id: str, model_dir: str):
+    """Downloads the ONNX export and tokenizer of a sentence-transformers model into model_dir."""
+    os.makedirs(model_dir, exist_ok=True)
+    for remote_path, local_name in ONNX_MODEL_FILES:
+        shutil.copyfile(hf_hub_download(repo_id, remote_path), os.path.join(model_dir, local_name))
+
+class OnnxEmbedder:
+    """
+    Local sentence embedder for an ONNX export of a sentence-transformers model
+    (e.g. all-MiniLM-L6-v2): mean-pools token embeddings and L2-normalizes them.
+    Expects 'model.onnx' and 'tokenizer.json' inside model_dir.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 128):
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, "model.onnx"),
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.embed = lru_cache(maxsize=1024)(self._embed_one)
+        self.dimension = self.embed_batch(["warm-up"]).shape[1]
+
+    def embed_batch(self, texts) -> np.ndarray:
+        """Embeds all texts with a single session.run call; returns a (len(texts), dimension) array."""
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., np.newaxis].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return (pooled / np.linalg.norm(pooled, axis=1, keepdims=True)).astype(np.float32)
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        vector = self.embed_batch([text])[0]
+        vector.setflags(write=False)
+        return vector
+
+class SemanticSQLCache:
+    """
+    Caches generated SQL queries keyed on the embedding of the user's question.
+    Questions whose embeddings are close enough (cosine similarity) to a previously
+    answered one reuse its SQL instead of calling the LLM again.
+    """
+
+    def __init__(self, embed_fn, dimension: int, threshold: float = 0.92, index_path: str = None, embed_batch_fn=None):
+        self.embed_fn = embed_fn
+        self.embed_batch_fn = embed_batch_fn
+        self.dimension = dimension
+        self.threshold = threshold
+        self.index_path = index_path
+        self.entries_path = f"{index_path}.json" if index_path else None
+        self.lock = threading.Lock()
+        self.index = faiss.IndexFlatIP(dimension)
+        self.entries = []
+        self.load()
+
+    def _embed(self, query: str) -> np.ndarray:
+        """Returns the query embedding as an L2-normalized (1, dimension) float32 array."""
+        return self._normalize(np.asarray(self.embed_fn(query), dtype=np.float32).reshape(1, -1))
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+
+    def lookup(self, query: str):
+        """Returns the cached SQL for a semantically equivalent question, or None on a miss."""
+        try:
+            vector = self._embed(query)
+        except Exception as e:
+            print(f"[Semantic Cache] Failed to embed query: {e}")
+            return None
+
+        with self.lock:
+            if self.index.ntotal == 0:
+                return None
+            similarities, ids = self.index.search(vector, 1)
+            similarity, entry_id = float(similarities[0][0]), int(ids[0][0])
+            if entry_id < 0 or similarity < self.threshold:
+                return None
+            cached_query, cached_sql = self.entries[entry_id]
+
+        if not literals_match(query, cached_query, cached_sql):
+            print(f"[Semantic Cache] Similar question '{cached_query}' asked for different values. Treating as a miss.")
+            return None
+        print(f"[Semantic Cache] Hit (similarity {similarity:.3f}) for cached question: '{cached_query}'")
+        return cached_sql
+
+    def add(self, query: str, sql: str):
+        """Stores the SQL generated for a question."""
+        try:
+            vector = self._embed(query)
+        except Exception as e:
+            print(f"[Semantic Cache] Failed to embed query: {e}")
+            return
+
+        with self.lock:
+            self.index.add(vector)
+            self.entries.append((query, sql))
+
+    def seed(self, pairs: list):
+        """
+        Adds known (question, sql) pairs that are not cached yet, embedding them in one batch
+        when a batch embedder is available.
+        """
+        with self.lock:
+            known_queries = {query for query, _ in self.entries}
+        pairs = [(query, sql) for query, sql in pairs if query not in known_queries]
+        if not pairs:
+            return
+        try:
+            queries = [query for query, _ in pairs]
+            if self.embed_batch_fn is not None:
+                vectors = np.asarray(self.embed_batch_fn(queries), dtype=np.float32)
+            else:
+                vectors = np.vstack([np.asarray(self.embed_fn(query), dtype=np.float32) for query in queries])
+        except Exception as e:
+            print(f"[Semantic Cache] Failed to embed seed queries: {e}")
+            return
+
+        with self.lock:
+            self.index.add(self._normalize(vectors.reshape(len(pairs), -1)))
+            self.entries.extend(pairs)
+        print(f"[Semantic Cache] Seeded {len(pairs)} queries.")
+
+    def clear(self):
+        """Drops every cached entry, e.g. after the database schema has changed."""
+        with self.lock:
+            self.index.reset()
+            self.entries = []
+
+    def load(self):
+        """Restores a previously persisted index, if one exists and is consistent."""
+        if not self.index_path or not os.path.exists(self.index_path) or not os.path.exists(self.entries_path):
+            return
+        try:
+            index = faiss.read_index(self.index_path)
+            with open(self.entries_path, encoding="utf-8") as f:
+                entries = [tuple(entry) for entry in json.load(f)]
+            if index.d != self.dimension or index.ntotal != len(entries):
+                print("[Semantic Cache] Persisted index does not match the current embedder. Ignoring it.")
+                return
+            self.index, self.entries = index, entries
+            print(f"[Semantic Cache] Loaded {len(entries)} cached queries.")
+        except Exception as e:
+            print(f"[Semantic Cache] Failed to load persisted index: {e}")
+
+    def save(self):
+        """Persists the index and its (query, sql) entries to disk."""
+        if not self.index_path:
+            return
+        with self.lock:
+            faiss.write_index(self.index, self.index_path)
+            with open(self.entries_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+        print(f"[Semantic Cache] Saved {len(self.entries)} cached queries.")
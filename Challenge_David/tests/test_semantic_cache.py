@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+
+from semantic_cache import SemanticSQLCache, literals_match
+
+TOP_BUDGET = (
+    "Quais os 5 incentivos com maior orçamento?",
+    "SELECT title, total_budget FROM incentives ORDER BY total_budget DESC LIMIT 5;"
+)
+CITY_SECTOR = (
+    "Mostra-me empresas de Lisboa do setor da restauração.",
+    "SELECT company_name FROM companies WHERE city LIKE '%Lisboa%' "
+    "AND (cae_primary_label LIKE '%restauração%' OR cae_primary_label LIKE '%restaurant%');"
+)
+QUOTED_TITLE = (
+    "Quais as melhores empresas para o incentivo 'Apoio à Digitalização'?",
+    "SELECT T2.company_name FROM matches AS T1 JOIN companies AS T2 ON T1.company_nif = T2.nif_code "
+    "JOIN incentives AS T3 ON T1.incentive_id = T3.incentive_id WHERE T3.title LIKE '%Apoio à Digitalização%';"
+)
+
+
+class LiteralsMatchTest(unittest.TestCase):
+
+    def test_same_question_matches(self):
+        for cached_query, cached_sql in (TOP_BUDGET, CITY_SECTOR, QUOTED_TITLE):
+            self.assertTrue(literals_match(cached_query, cached_query, cached_sql))
+
+    def test_paraphrase_with_same_values_matches(self):
+        self.assertTrue(literals_match("Mostra-me as empresas de Lisboa na restauração", *CITY_SECTOR))
+        self.assertTrue(literals_match("Quais são os 5 incentivos de maior orçamento?", *TOP_BUDGET))
+
+    def test_different_or_missing_number_misses(self):
+        self.assertFalse(literals_match("Quais os 10 incentivos com maior orçamento?", *TOP_BUDGET))
+        self.assertFalse(literals_match("Quais os incentivos com maior orçamento?", *TOP_BUDGET))
+
+    def test_different_capitalized_name_misses(self):
+        self.assertFalse(literals_match("Mostra-me empresas do Porto do setor da restauração.", *CITY_SECTOR))
+
+    def test_different_bound_value_misses(self):
+        self.assertFalse(literals_match("Mostra-me empresas de Lisboa do setor da hotelaria.", *CITY_SECTOR))
+
+    def test_different_quoted_term_misses(self):
+        self.assertFalse(literals_match("Quais as melhores empresas para o incentivo 'Apoio à Inovação'?", *QUOTED_TITLE))
+
+
+class SemanticSQLCacheLookupTest(unittest.TestCase):
+
+    def setUp(self):
+        # Every question embeds to the same vector, so only the literal check tells them apart.
+        self.cache = SemanticSQLCache(embed_fn=lambda query: np.ones(4, dtype=np.float32), dimension=4, threshold=0.9)
+        self.cache.add(*CITY_SECTOR)
+
+    def test_similar_question_with_same_values_hits(self):
+        self.assertEqual(self.cache.lookup("Mostra-me as empresas de Lisboa na restauração"), CITY_SECTOR[1])
+
+    def test_similar_question_with_other_values_misses(self):
+        self.assertIsNone(self.cache.lookup("Mostra-me empresas do Porto do setor da restauração."))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from llm_services import match_sql_template, MAX_TEMPLATE_LIMIT
+
+
+class MatchSqlTemplateTest(unittest.TestCase):
+
+    def test_top_incentives_by_budget(self):
+        sql, params = match_sql_template("Quais os 5 incentivos com maior orçamento?")
+        self.assertIn("ORDER BY total_budget DESC LIMIT :limit", sql)
+        self.assertEqual(params, {"limit": 5})
+
+    def test_limit_is_capped(self):
+        _, params = match_sql_template("top 5000 incentives by budget")
+        self.assertEqual(params["limit"], MAX_TEMPLATE_LIMIT)
+
+    def test_best_companies_for_quoted_incentive(self):
+        sql, params = match_sql_template("Quais as 3 melhores empresas para o incentivo 'Apoio à Digitalização'?")
+        self.assertIn("T3.title LIKE '%' || :title || '%'", sql)
+        self.assertEqual(params, {"limit": 3, "title": "Apoio à Digitalização"})
+
+    def test_best_companies_default_limit_and_typographic_quotes(self):
+        _, params = match_sql_template("best companies for the incentive “Vale Inovação”")
+        self.assertEqual(params, {"limit": 10, "title": "Vale Inovação"})
+
+    def test_companies_in_city(self):
+        sql, params = match_sql_template("Quais as empresas da cidade de Lisboa?")
+        self.assertIn("city LIKE '%' || :city || '%'", sql)
+        self.assertEqual(params, {"city": "Lisboa"})
+
+    def test_companies_in_multi_word_city(self):
+        _, params = match_sql_template("Mostra-me empresas da cidade de Vila Nova de Gaia")
+        self.assertEqual(params, {"city": "Vila Nova de Gaia"})
+        _, params = match_sql_template("show me companies in the city of Porto?")
+        self.assertEqual(params, {"city": "Porto"})
+
+    def test_city_with_extra_conditions_falls_through(self):
+        self.assertIsNone(match_sql_template("Quais as empresas da cidade de Lisboa com mais de 100 empregados?"))
+        self.assertIsNone(match_sql_template("companies in the city of Lisbon with more than 100 employees"))
+
+    def test_unquoted_or_qualified_title_falls_through(self):
+        self.assertIsNone(match_sql_template("Quais as melhores empresas para o incentivo Apoio à Digitalização em Lisboa?"))
+        self.assertIsNone(match_sql_template("Quais as melhores empresas para o incentivo 'Apoio à Digitalização' em Lisboa?"))
+
+    def test_qualified_budget_question_falls_through(self):
+        self.assertIsNone(match_sql_template("Quais os 5 incentivos com maior orçamento em Lisboa?"))
+
+    def test_unrelated_question_falls_through(self):
+        self.assertIsNone(match_sql_template("Mostra-me empresas de Lisboa do setor da restauração."))
+
+
+if __name__ == "__main__":
+    unittest.main()